@@ -3,7 +3,8 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import hashlib
-import json
+
+from types import MappingProxyType
 
 from tasks import (
     Task,
@@ -29,25 +30,38 @@ def sources_list(snapshot, sections):
         )
 
 
+def apt_install(*packages):
+    return 'apt-get install -y --no-install-recommends {}'.format(
+        ' '.join(sorted(packages)))
+
+
+DEBIAN_RELEASE = 'bullseye'
+
 LLVM_REPO = (
     'echo'
     ' deb [signed-by=/usr/share/keyrings/llvm.gpg]'
-    ' https://apt.llvm.org/bullseye/ llvm-toolchain-bullseye-18 main'
-    ' > /etc/apt/sources.list.d/llvm.list'
+    ' https://apt.llvm.org/{0}/ llvm-toolchain-{0}-18 main'
+    ' > /etc/apt/sources.list.d/llvm.list'.format(DEBIAN_RELEASE),
+    # The base image already has up-to-date lists for the debian snapshot,
+    # so only fetch the lists for the LLVM repository.
+    'apt-get update -o Acquire::Check-Valid-Until=false'
+    ' -o Dir::Etc::sourcelist=sources.list.d/llvm.list'
+    ' -o Dir::Etc::sourceparts=-'
+    ' -o APT::Get::List-Cleanup=0',
 )
 
 DOCKER_IMAGES = {
     'base': {
-        'from': 'debian:bullseye-20220801',
+        'from': 'debian:{}-20220801'.format(DEBIAN_RELEASE),
         'commands': [
             '({}) > /etc/apt/sources.list'.format('; '.join(
                 'echo ' + l for l in sources_list('20220801T205040Z', (
-                    ('debian', 'bullseye'),
-                    ('debian', 'bullseye-updates'),
-                    ('debian-security', 'bullseye-security'),
+                    ('debian', DEBIAN_RELEASE),
+                    ('debian', '{}-updates'.format(DEBIAN_RELEASE)),
+                    ('debian-security', '{}-security'.format(DEBIAN_RELEASE)),
                 )))),
             'apt-get update -o Acquire::Check-Valid-Until=false',
-            'apt-get install -y --no-install-recommends {}'.format(' '.join([
+            apt_install(
                 'apt-transport-https',
                 'bzip2',
                 'ca-certificates',
@@ -61,7 +75,10 @@ DOCKER_IMAGES = {
                 'xz-utils',
                 'zip',
                 'zstd',
-            ])),
+            ),
+            # Keep the apt lists around, images derived from this one
+            # install packages without running `apt-get update`. Leaf
+            # images remove them.
             'apt-get clean',
             'curl -sO https://apt.llvm.org/llvm-snapshot.gpg.key',
             'gpg --no-default-keyring --keyring /usr/share/keyrings/llvm.gpg'
@@ -81,9 +98,8 @@ DOCKER_IMAGES = {
     'build': {
         'from': 'base',
         'commands': [
-            LLVM_REPO,
-            'apt-get update -o Acquire::Check-Valid-Until=false',
-            'apt-get install -y --no-install-recommends {}'.format(' '.join([
+            *LLVM_REPO,
+            apt_install(
                 'clang-18',
                 'lld-18',
                 'git',
@@ -95,7 +111,7 @@ DOCKER_IMAGES = {
                 'symlinks',
                 'fakechroot',
                 'gcc-mingw-w64-x86-64-win32',
-            ])),
+            ),
             'for arch in amd64 arm64; do'
             ' mmdebstrap -d'
             '  --architecture=$arch'
@@ -108,13 +124,14 @@ DOCKER_IMAGES = {
             '  symlinks -crv /;'
             'done',
             'apt-get clean',
+            'rm -rf /var/lib/apt/lists/*',
         ],
     },
 
     'build-tools': {
         'from': 'base',
         'commands': [
-            'apt-get install -y --no-install-recommends {}'.format(' '.join([
+            apt_install(
                 'gcc',
                 'git',
                 'libc6-dev',
@@ -124,20 +141,22 @@ DOCKER_IMAGES = {
                 'python-dev',
                 'python3-dev',
                 'zlib1g-dev',
-            ])),
+            ),
             'apt-get clean',
+            'rm -rf /var/lib/apt/lists/*',
         ],
     },
 
     'codecov': {
         'from': 'base',
         'commands': [
-            'apt-get install -y --no-install-recommends {}'.format(' '.join([
+            apt_install(
                 'gcc',
                 'git',
                 'python3-coverage',
-            ])),
+            ),
             'apt-get clean',
+            'rm -rf /var/lib/apt/lists/*',
             'ln -s /usr/bin/python3-coverage /usr/local/bin/coverage',
             'curl -o /usr/local/bin/codecov -sL {}'.format(
                 'https://github.com/codecov/uploader/releases/download'
@@ -154,19 +173,25 @@ DOCKER_IMAGES = {
     'test': {
         'from': 'base',
         'commands': [
-            LLVM_REPO,
-            'apt-get update -o Acquire::Check-Valid-Until=false',
-            'apt-get install -y --no-install-recommends {}'.format(' '.join([
+            *LLVM_REPO,
+            apt_install(
                 'llvm-18',
                 'make',
-            ])),
+            ),
             'apt-get clean',
+            'rm -rf /var/lib/apt/lists/*',
             'pip3 install cram==0.7',
             'ln -s llvm-symbolizer-18 /usr/bin/llvm-symbolizer'
         ],
     },
 }
 
+# Freeze the definitions, so that they can't change under DockerImage.
+DOCKER_IMAGES = MappingProxyType({
+    name: MappingProxyType(dict(defn, commands=tuple(defn['commands'])))
+    for name, defn in DOCKER_IMAGES.items()
+})
+
 
 class DockerImage(Task, metaclass=TaskEnvironment):
     PREFIX = 'linux'
@@ -181,6 +206,12 @@ class DockerImage(Task, metaclass=TaskEnvironment):
             base = DockerImage.by_name(base)
         self.base = base
         self.definition = defn['commands']
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(base).encode())
+        for command in self.definition:
+            h.update(b'\0')
+            h.update(command.encode())
+        self.hexdigest = h.hexdigest()
 
         Task.__init__(
             self,
@@ -205,13 +236,6 @@ class DockerImage(Task, metaclass=TaskEnvironment):
     def index(self):
         return '.'.join((self.PREFIX, self.name, self.hexdigest))
 
-    @property
-    def hexdigest(self):
-        h = hashlib.sha1()
-        h.update(str(self.base).encode())
-        h.update(json.dumps(self.definition).encode())
-        return h.hexdigest()
-
     def prepare_params(self, params):
         commands = ["mkdir artifacts"]
         image = params.pop('image', self)
@@ -248,7 +272,7 @@ class DockerImage(Task, metaclass=TaskEnvironment):
                 'exit_code=$?',
                 'podman commit taskcontainer taskcontainer',
                 'podman save taskcontainer'
-                ' | zstd > artifacts/dockerImage.tar.zst',
+                ' | zstd -T0 > artifacts/dockerImage.tar.zst',
                 'podman rm taskcontainer',
                 'exit $exit_code',
             ])
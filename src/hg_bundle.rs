@@ -886,10 +886,12 @@ impl<R: Read> BundleConnection<R> {
                 let parent2 = HgChangesetId::from_unchecked(chunk.parent2());
                 let delta_node = HgChangesetId::from_unchecked(chunk.delta_node());
                 let parents = [parent1, parent2];
-                let parents = parents
-                    .into_iter()
-                    .filter(|p| !p.is_null())
-                    .collect::<Vec<_>>();
+                let parents = match (parent1.is_null(), parent2.is_null()) {
+                    (false, false) => &parents[..],
+                    (false, true) => &parents[..1],
+                    (true, false) => &parents[1..],
+                    (true, true) => &parents[..0],
+                };
 
                 let reference_cs = if delta_node.is_null() {
                     &empty_cs
@@ -918,7 +920,7 @@ impl<R: Read> BundleConnection<R> {
                     .unwrap_or(b"default")
                     .as_bstr();
 
-                changesets.add(node, &parents, branch);
+                changesets.add(node, parents, branch);
                 raw_changesets.insert(node, raw_changeset);
             }
             break;
@@ -1055,18 +1057,27 @@ fn write_chunk<T: core::ops::Deref<Target = [u8]>>(
         chunk_data.into_iter().min_by_key(|(_, d)| d.len()).unwrap()
     };
     *previous = Some((node, raw_object));
-    writer.write_u32::<BigEndian>(
-        (4 + chunk.len() + 80 + if version == 2 { 20 } else { 0 })
-            .try_into()
-            .unwrap(),
-    )?;
-    writer.write_all(node.as_raw_bytes())?;
-    writer.write_all(parent1.as_raw_bytes())?;
-    writer.write_all(parent2.as_raw_bytes())?;
-    if version == 2 {
-        writer.write_all(delta_node.unwrap_or(HgObjectId::NULL).as_raw_bytes())?;
-    }
-    writer.write_all(changeset.as_raw_bytes())?;
+    // Assemble the chunk header on the stack so that it goes to the writer
+    // in one go.
+    let mut header = [0; 104];
+    let header_len = {
+        let mut buf = &mut header[..];
+        buf.write_u32::<BigEndian>(
+            (4 + chunk.len() + 80 + if version == 2 { 20 } else { 0 })
+                .try_into()
+                .unwrap(),
+        )?;
+        buf.write_all(node.as_raw_bytes())?;
+        buf.write_all(parent1.as_raw_bytes())?;
+        buf.write_all(parent2.as_raw_bytes())?;
+        if version == 2 {
+            buf.write_all(delta_node.unwrap_or(HgObjectId::NULL).as_raw_bytes())?;
+        }
+        buf.write_all(changeset.as_raw_bytes())?;
+        let remaining = buf.len();
+        header.len() - remaining
+    };
+    writer.write_all(&header[..header_len])?;
     writer.write_all(&chunk)
 }
 